@@ -1,23 +1,35 @@
+import asyncio
+import hashlib
 import logging
 import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from fastapi import APIRouter, Depends, Form, HTTPException, UploadFile, File
-from fastapi.responses import HTMLResponse, JSONResponse
+from functools import lru_cache
+from fastapi import APIRouter, Depends, Form, HTTPException, Path, Request, UploadFile, File
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 from starlette.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, func
 
 from app.core.config import get_settings
+from app.core.http import accepts_gzip, etag_matches, gzip_page, page_cache_headers
 from app.core.database import get_db
 from app.models.challenge import Challenge
 from app.services.tts import generate_ai_audio, TTSVCError, get_max_script_chars
-from app.services.audio import convert_to_wav, AudioProcessingError
+from app.services.audio import convert_to_wav, read_upload_limited, AudioProcessingError
 from app.services import storage
 from app.services.unlock import consume_unlock_token, UnlockError
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
-router = APIRouter(tags=["challenge"])
+router = APIRouter(tags=["challenge"], default_response_class=ORJSONResponse)
+
+# create_challenge 热路径用到的配置项，导入时绑定成模块常量
+_MAX_UPLOAD_MB = settings.audio_max_size_mb
+_MAX_UPLOAD_BYTES = _MAX_UPLOAD_MB * 1024 * 1024
+_RATE_LIMIT_WINDOW = timedelta(seconds=settings.rate_limit_window_seconds)
+_RATE_LIMIT_PER_DEVICE = settings.rate_limit_per_device
+_BASE_URL = settings.base_url
 
 
 def _is_audio_quality_issue(error_text: str) -> bool:
@@ -83,6 +95,92 @@ def _normalize_generation_text(text: str | None, lang: str) -> str | None:
     return normalized
 
 
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def _discard_upload(upload_task: asyncio.Future, challenge_id: str) -> None:
+    """数据库侧失败时，等并行的上传结束后删除已上传的音频（上传本身失败则无需清理）"""
+    try:
+        await upload_task
+    except Exception:
+        return
+    try:
+        await run_in_threadpool(storage.delete_audio, challenge_id)
+    except Exception:
+        logger.exception("清理未提交的 fake 音频失败: %s", challenge_id)
+
+
+def _discard_upload_in_background(upload_task: asyncio.Future, challenge_id: str) -> None:
+    # 请求被取消（客户端断开，CancelledError 不是 Exception）时当前任务里已无法再 await，
+    # 清理交给独立任务，保证已上传的音频不会成为孤儿对象
+    task = asyncio.create_task(_discard_upload(upload_task, challenge_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+# ─── 设备频率限制 ─────────────────────────────────────────────────────────────
+# 已超限的设备记下"最早可再次创建的时间"：在窗口内最早一条记录移出窗口之前，
+# 计数只会增加不会减少，这段时间内的重试直接在内存里拒绝，不再查数据库
+
+_RATE_LIMITED_UNTIL_MAX = 10_000
+_rate_limited_until: dict[str, datetime] = {}
+
+
+def _rate_limited_error() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail={"error_code": "RATE_LIMITED", "message": "创建频率超限，请稍后再试"},
+    )
+
+
+async def _enforce_rate_limit(db: AsyncSession, device_id: str) -> None:
+    now = datetime.now(timezone.utc)
+    until = _rate_limited_until.get(device_id)
+    if until is not None:
+        if now < until:
+            raise _rate_limited_error()
+        del _rate_limited_until[device_id]
+
+    result = await db.execute(
+        select(func.count(), func.min(Challenge.created_at))
+        .where(
+            and_(
+                Challenge.device_id == device_id,
+                Challenge.created_at >= now - _RATE_LIMIT_WINDOW,
+            )
+        )
+    )
+    recent_count, oldest_created_at = result.one()
+    if recent_count >= _RATE_LIMIT_PER_DEVICE:
+        if len(_rate_limited_until) >= _RATE_LIMITED_UNTIL_MAX:
+            for expired in [k for k, v in _rate_limited_until.items() if v <= now]:
+                del _rate_limited_until[expired]
+        if oldest_created_at is not None and len(_rate_limited_until) < _RATE_LIMITED_UNTIL_MAX:
+            _rate_limited_until[device_id] = oldest_created_at + _RATE_LIMIT_WINDOW
+        raise _rate_limited_error()
+
+
+# ─── challenge_id → fake_url 进程内 LRU ───────────────────────────────────────
+# challenge 写入后 fake_url 不再变化，热门链接直接命中内存，不占用数据库连接
+
+_FAKE_URL_CACHE_SIZE = 10_000
+_fake_url_cache: OrderedDict[str, str] = OrderedDict()
+
+
+def _get_cached_fake_url(challenge_id: str) -> str | None:
+    fake_url = _fake_url_cache.get(challenge_id)
+    if fake_url is not None:
+        _fake_url_cache.move_to_end(challenge_id)
+    return fake_url
+
+
+def _cache_fake_url(challenge_id: str, fake_url: str) -> None:
+    _fake_url_cache[challenge_id] = fake_url
+    _fake_url_cache.move_to_end(challenge_id)
+    if len(_fake_url_cache) > _FAKE_URL_CACHE_SIZE:
+        _fake_url_cache.popitem(last=False)
+
+
 # ─── POST /test_upload（仅测试用，验证 R2 上传和公开 URL）────────────────────
 
 @router.post("/test_upload")
@@ -90,10 +188,10 @@ async def test_upload(audio: UploadFile = File(...)):
     """上传音频到 R2，返回公开 URL，用于验证 R2 是否正常工作（仅开发环境）"""
     if settings.app_env != "development":
         raise HTTPException(status_code=404, detail="Not found")
-    audio_bytes = await audio.read()
-    key = f"test/{uuid.uuid4()}.wav"
-    url = await run_in_threadpool(storage.upload_raw, key, audio_bytes)
-    return JSONResponse({"key": key, "public_url": url})
+    key = f"test/{uuid.uuid4().hex}.wav"
+    # 直接把 SpooledTemporaryFile 交给 put_object 流式上传，不在内存里再复制一份
+    url = await run_in_threadpool(storage.upload_raw, key, audio.file)
+    return ORJSONResponse({"key": key, "public_url": url})
 
 
 # ─── POST /create_challenge ──────────────────────────────────────────────────
@@ -111,13 +209,13 @@ async def create_challenge(
     接收 App 上传的录音，生成 fake 语音并返回挑战页面 URL。
 
     流程：
-    1. 读取音频 buffer（内存，不落盘）
+    1. 分块读取音频 buffer（内存，不落盘，超限提前拒绝）
     2. 自动检测格式并转换为 WAV（支持 m4a/mp3/ogg/flac 等）
     3. 发送到阿里云 TTS-VC API 生成 fake 音频
-    4. 生成 challenge_id (UUID)
-    5. 上传 fake 音频到 R2: fake/{challenge_id}.wav
-    6. 原始音频立即丢弃
-    7. 写入 challenges 表
+    4. 生成 challenge_id (UUID hex，32 位无连字符)
+    5. 原始音频立即丢弃
+    6. 上传 fake 音频到 R2: fake/{challenge_id}.wav，同时消费解锁令牌并写入 challenges 表
+    7. 上传成功后提交事务
     8. 返回 challenge_url
     """
     # ── 校验解锁凭证 ──
@@ -128,39 +226,24 @@ async def create_challenge(
         )
 
     # ── 设备频率限制 ──
-    window_start = datetime.now(timezone.utc) - timedelta(
-        seconds=settings.rate_limit_window_seconds
-    )
-    rate_result = await db.execute(
-        select(Challenge).where(
-            and_(
-                Challenge.device_id == device_id,
-                Challenge.created_at >= window_start,
-            )
-        )
-    )
-    recent_count = len(rate_result.scalars().all())
-    if recent_count >= settings.rate_limit_per_device:
-        raise HTTPException(
-            status_code=429,
-            detail={"error_code": "RATE_LIMITED", "message": "创建频率超限，请稍后再试"},
-        )
+    await _enforce_rate_limit(db, device_id)
 
-    # ── 读取音频到内存 buffer，不落盘 ──
-    max_bytes = settings.audio_max_size_mb * 1024 * 1024
-    audio_bytes = await audio.read()
-    if len(audio_bytes) > max_bytes:
+    # ── 分块读取音频到内存 buffer，不落盘，超限提前 413 ──
+    try:
+        audio_buf = await read_upload_limited(audio, _MAX_UPLOAD_BYTES)
+    except AudioProcessingError as e:
         raise HTTPException(
             status_code=413,
-            detail={"error_code": "FILE_TOO_LARGE", "message": f"文件超过 {settings.audio_max_size_mb}MB 限制"},
+            detail={"error_code": e.error_code, "message": str(e)},
         )
 
     generation_text = _normalize_generation_text(text, lang)
 
-    # ── 格式转换：统一转成 WAV ──
+    # ── 格式转换：统一转成 WAV（pydub/ffmpeg 是阻塞调用，放到线程池，不卡事件循环）──
     try:
-        audio_bytes = convert_to_wav(
-            audio_bytes,
+        audio_bytes = await run_in_threadpool(
+            convert_to_wav,
+            audio_buf,
             filename=audio.filename or "",
             content_type=audio.content_type or "",
         )
@@ -169,9 +252,11 @@ async def create_challenge(
             status_code=422,
             detail={"error_code": e.error_code, "message": str(e)},
         )
+    finally:
+        del audio_buf
 
     # ── 生成 challenge_id ──
-    challenge_id = str(uuid.uuid4())
+    challenge_id = uuid.uuid4().hex
 
     # ── 调用阿里云 TTS-VC 生成 fake 音频（直接传 bytes，不落盘）──
     try:
@@ -182,7 +267,7 @@ async def create_challenge(
         )
     except TTSVCError as e:
         err_detail = str(e)
-        logger.error(f"TTS-VC 生成失败: {err_detail}")
+        logger.error("TTS-VC 生成失败: %s", err_detail)
         if _is_audio_quality_issue(err_detail):
             raise HTTPException(
                 status_code=422,
@@ -198,34 +283,58 @@ async def create_challenge(
     finally:
         del audio_bytes  # 原始音频立即丢弃
 
-    # ── 上传 fake 音频到 R2: fake/{challenge_id}.wav ──
-    try:
-        fake_url = await run_in_threadpool(storage.upload_audio, challenge_id, fake_audio)
-    except Exception as e:
-        logger.error(f"R2 上传失败: {e}")
-        raise HTTPException(
-            status_code=503,
-            detail={"error_code": "STORAGE_FAILED", "message": "音频存储失败，请重试"},
-        )
-    finally:
-        del fake_audio
+    # ── 上传 fake 音频到 R2 与数据库写入并行 ──
+    # fake_url 由 challenge_id 直接决定，不必等上传返回：上传在线程池里进行的同时，
+    # 消费解锁令牌 + 插入 challenge（同一事务，先 flush 不提交），上传成功后再提交
+    fake_url = storage.get_fake_url(challenge_id)
+    upload_task = asyncio.ensure_future(
+        run_in_threadpool(storage.upload_audio, challenge_id, fake_audio)
+    )
+    del fake_audio
 
-    # ── 消费一次性解锁令牌 + 写入数据库（同一事务） ──
+    # 提交成功之前的任何退出（包括请求被取消、提交失败）都要清理已上传的音频；
+    # 只有提交过程中被取消时结果未知，宁可留下孤儿对象也不删掉可能已落库的 challenge 音频
+    discard = True
     try:
-        await consume_unlock_token(db, device_id=device_id, token=unlock_proof.strip())
-    except UnlockError as e:
-        raise HTTPException(
-            status_code=e.status_code,
-            detail={"error_code": e.error_code, "message": e.message},
-        )
+        try:
+            await consume_unlock_token(db, device_id=device_id, token=unlock_proof.strip())
+            db.add(Challenge(id=challenge_id, fake_url=fake_url, device_id=device_id))
+            await db.flush()
+        except UnlockError as e:
+            raise HTTPException(
+                status_code=e.status_code,
+                detail={"error_code": e.error_code, "message": e.message},
+            )
 
-    challenge = Challenge(id=challenge_id, fake_url=fake_url, device_id=device_id)
-    db.add(challenge)
-    await db.commit()
+        # shield：请求被取消时不连带取消上传 future（线程里的 PUT 反正会跑完），
+        # 后台清理任务才能等到上传结束再删除
+        try:
+            await asyncio.shield(upload_task)
+        except Exception as e:
+            logger.error("R2 上传失败: %s", e, exc_info=True)
+            await db.rollback()
+            raise HTTPException(
+                status_code=503,
+                detail={"error_code": "STORAGE_FAILED", "message": "音频存储失败，请重试"},
+            )
 
-    challenge_url = f"{settings.base_url}/c/{challenge_id}"
-    logger.info(f"Challenge 创建成功: {challenge_id}")
-    return JSONResponse({"challenge_url": challenge_url})
+        # 响应体只依赖 challenge_id，提交前先序列化好；提交成功后直接返回
+        # （不能改成后台提交：令牌消费必须落库，且 App 拿到链接后会立即打开 /c/{id}）
+        response = ORJSONResponse({"challenge_url": f"{_BASE_URL}/c/{challenge_id}"})
+        try:
+            await db.commit()
+        except asyncio.CancelledError:
+            discard = False
+            raise
+        discard = False
+    finally:
+        if discard:
+            _discard_upload_in_background(upload_task, challenge_id)
+
+    _cache_fake_url(challenge_id, fake_url)
+
+    logger.info("Challenge 创建成功: %s", challenge_id)
+    return response
 
 
 # ─── GET /c/{challenge_id} ───────────────────────────────────────────────────
@@ -365,23 +474,72 @@ CHALLENGE_HTML = """<!DOCTYPE html>
 </body>
 </html>"""
 
+# 模板里只有 {fake_url} 一个变量：启动时一次性展开 {{ }} 转义并切成前后两段 bytes，
+# 请求时只做拼接，不再每次跑 str.format + utf-8 编码
+_CHALLENGE_HTML_PREFIX, _CHALLENGE_HTML_SUFFIX = (
+    part.encode("utf-8") for part in CHALLENGE_HTML.format(fake_url="\x00").split("\x00")
+)
+
+
+def _render_challenge_html(fake_url: str) -> bytes:
+    return _CHALLENGE_HTML_PREFIX + fake_url.encode("utf-8") + _CHALLENGE_HTML_SUFFIX
+
+
+@lru_cache(maxsize=1024)
+def _render_challenge_html_gzip(fake_url: str) -> bytes:
+    """整页 gzip 结果按 fake_url 缓存，热门链接只压缩一次"""
+    return gzip_page(_render_challenge_html(fake_url))
+
+
+# (challenge_id, fake_url) 写入后不变，页面只随模板（部署）变化：
+# ETag 带上模板指纹，配合长缓存让 CDN / 浏览器直接复用，回源时 If-None-Match 命中即 304
+_CHALLENGE_HTML_VERSION = hashlib.sha1(_CHALLENGE_HTML_PREFIX + _CHALLENGE_HTML_SUFFIX).hexdigest()[:8]
+_CHALLENGE_PAGE_CACHE_CONTROL = "public, max-age=86400, immutable"
+
+# challenge_id：uuid4().hex（旧数据为带连字符的 UUID），格式不符直接 422，不查缓存 / 数据库
+_CHALLENGE_ID_PATTERN = r"^(?:[0-9a-f]{32}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$"
+
+
+def _challenge_page_etag(challenge_id: str) -> str:
+    # 弱 ETag：gzip 与原文两种编码语义相同，共用一个 ETag
+    return f'W/"{challenge_id}-{_CHALLENGE_HTML_VERSION}"'
+
 
 @router.get("/c/{challenge_id}", response_class=HTMLResponse)
 async def challenge_page(
-    challenge_id: str,
+    request: Request,
+    challenge_id: str = Path(..., pattern=_CHALLENGE_ID_PATTERN),
     db: AsyncSession = Depends(get_db),
 ):
     """
-    挑战网页：查询数据库获取 fake_url，返回包含音频播放器的 HTML 页面。
-    页面无动态逻辑，仅播放 fake 音频。
+    挑战网页：获取 fake_url（优先进程内缓存，未命中再查数据库），
+    返回包含音频播放器的 HTML 页面。页面无动态逻辑，仅播放 fake 音频。
+    客户端支持 gzip 时直接返回预压缩好的页面；带 ETag / 长缓存头，
+    If-None-Match 命中直接 304，不查缓存也不查数据库。
     """
-    result = await db.execute(
-        select(Challenge).where(Challenge.id == challenge_id)
-    )
-    challenge = result.scalars().first()
+    etag = _challenge_page_etag(challenge_id)
+    cache_headers = page_cache_headers(etag, _CHALLENGE_PAGE_CACHE_CONTROL, "Accept-Encoding")
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers)
+
+    fake_url = _get_cached_fake_url(challenge_id)
+    if fake_url is None:
+        # 只取 fake_url 一列，不实例化 ORM 对象
+        result = await db.execute(
+            select(Challenge.fake_url).where(Challenge.id == challenge_id)
+        )
+        fake_url = result.scalar_one_or_none()
+        if fake_url is None:
+            raise HTTPException(status_code=404, detail="Challenge not found")
 
-    if challenge is None:
-        raise HTTPException(status_code=404, detail="Challenge not found")
+        _cache_fake_url(challenge_id, fake_url)
 
-    html = CHALLENGE_HTML.format(fake_url=challenge.fake_url)
-    return HTMLResponse(content=html)
+    if accepts_gzip(request):
+        return HTMLResponse(
+            content=_render_challenge_html_gzip(fake_url),
+            headers={**cache_headers, "Content-Encoding": "gzip"},
+        )
+    return HTMLResponse(
+        content=_render_challenge_html(fake_url),
+        headers=cache_headers,
+    )
@@ -1,12 +1,12 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Path, UploadFile, File, Form
 from fastapi.responses import RedirectResponse
 from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import get_settings
 from app.core.database import get_db
-from app.services.audio import convert_to_wav, AudioProcessingError
+from app.services.audio import convert_to_wav, read_upload_limited, AudioProcessingError
 from app.services.tts import generate_ai_audio, TTSVCError, get_max_script_chars
 from app.services import share as share_service
 from app.services import storage
@@ -114,11 +114,12 @@ async def create_share(
     """
     # ── 文件大小检查 ──
     max_bytes = settings.audio_max_size_mb * 1024 * 1024
-    contents = await audio_file.read()
-    if len(contents) > max_bytes:
+    try:
+        contents = await read_upload_limited(audio_file, max_bytes)
+    except AudioProcessingError as e:
         raise HTTPException(
             status_code=413,
-            detail={"error_code": "FILE_TOO_LARGE", "message": f"文件超过 {settings.audio_max_size_mb}MB 限制"},
+            detail={"error_code": e.error_code, "message": str(e)},
         )
 
     generation_text = _normalize_generation_text(text, lang)
@@ -138,9 +139,10 @@ async def create_share(
             detail={"error_code": "UNLOCK_REQUIRED", "message": "需要付费或完成关卡解锁"},
         )
 
-    # ── 音频处理 ──
+    # ── 音频处理（pydub/ffmpeg 是阻塞调用，放到线程池，不卡事件循环）──
     try:
-        processed_audio = convert_to_wav(
+        processed_audio = await run_in_threadpool(
+            convert_to_wav,
             contents,
             filename=audio_file.filename or "",
             content_type=audio_file.content_type or "",
@@ -150,6 +152,8 @@ async def create_share(
             status_code=422,
             detail={"error_code": e.error_code, "message": str(e)},
         )
+    finally:
+        del contents
 
     # ── TTS-VC 生成 AI 音频 ──
     try:
@@ -160,7 +164,7 @@ async def create_share(
         )
     except TTSVCError as e:
         err_detail = str(e)
-        logger.error(f"TTS-VC 生成失败: {err_detail}")
+        logger.error("TTS-VC 生成失败: %s", err_detail)
         if _is_audio_quality_issue(err_detail):
             raise HTTPException(
                 status_code=422,
@@ -202,12 +206,12 @@ async def create_share(
 
 @router.get("/{share_id}/audio")
 async def get_audio(
-    share_id: str,
+    share_id: str = Path(..., pattern=r"^[0-9a-f]{12}$"),
     db: AsyncSession = Depends(get_db),
 ):
     """
     受控音频播放入口：
-    - 先校验 share 是否可访问
+    - 先校验 share 是否可访问（active share 的音频在写库前已上传，无需再 HEAD R2）
     - 校验通过后 307 重定向到 R2 直链，音频流量由 R2/CDN 承载
     """
     share = await share_service.get_share(db, share_id)
@@ -218,10 +222,6 @@ async def get_audio(
             detail={"error_code": "SHARE_UNAVAILABLE", "message": "挑战已过期或不存在"},
         )
 
-    exists = await run_in_threadpool(storage.audio_exists, share_id)
-    if not exists:
-        raise HTTPException(status_code=404, detail={"error_code": "AUDIO_NOT_FOUND", "message": "音频不存在"})
-
     return RedirectResponse(
         url=storage.get_fake_url(share_id),
         status_code=307,
@@ -1,13 +1,15 @@
+import hashlib
 import logging
+import re
+from functools import lru_cache
 from fastapi import APIRouter, Depends, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.config import get_settings
 from app.core.database import get_db
+from app.core.http import accepts_gzip, etag_matches, gzip_page, page_cache_headers
 from app.services import share as share_service
 
 logger = logging.getLogger(__name__)
-settings = get_settings()
 router = APIRouter(tags=["webpage"])
 
 # ─── 挑战页面 HTML 模板 ──────────────────────────────────────────────────────
@@ -173,16 +175,21 @@ CHALLENGE_PAGE = """<!DOCTYPE html>
 EXPIRED_PAGE = """<!DOCTYPE html>
 <html><head><meta charset="UTF-8"/>
 <title>Challenge Expired</title>
-<style>body{{font-family:sans-serif;display:flex;align-items:center;justify-content:center;
-min-height:100vh;background:#0f172a;color:#f1f5f9;text-align:center;padding:24px;}}
-.card{{background:#1e293b;border-radius:16px;padding:40px;max-width:400px;}}
-h1{{margin-bottom:12px;color:#f87171;}}p{{color:#94a3b8;}}</style>
+<style>body{font-family:sans-serif;display:flex;align-items:center;justify-content:center;
+min-height:100vh;background:#0f172a;color:#f1f5f9;text-align:center;padding:24px;}
+.card{background:#1e293b;border-radius:16px;padding:40px;max-width:400px;}
+h1{margin-bottom:12px;color:#f87171;}p{color:#94a3b8;}</style>
 </head><body><div class="card">
 <h1>⏰ 挑战已过期 / Challenge Expired</h1>
 <p>该链接已超过 72 小时或被访问 50 次，已自动删除。<br/>
 This link expired after 72h or 50 visits and was deleted.</p>
 </div></body></html>"""
 
+# 过期页是纯静态内容（不走 .format），启动时编码一次
+_EXPIRED_PAGE_BYTES = EXPIRED_PAGE.encode("utf-8")
+# 过期 / 删除不可逆，允许浏览器和 CDN 缓存 410，不再回源查库
+_EXPIRED_PAGE_CACHE_CONTROL = "public, max-age=3600"
+
 
 I18N = {
     "zh": {
@@ -215,6 +222,66 @@ I18N = {
     },
 }
 
+_HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+
+
+def _minify_html(html: str) -> str:
+    """保守压缩：去掉 HTML 注释、每行首尾缩进和空行，保留换行（内联 JS 的 // 注释、ASI 不受影响）"""
+    html = _HTML_COMMENT_RE.sub("", html)
+    return "\n".join(line.strip() for line in html.splitlines() if line.strip())
+
+
+# 每种语言只有 share_id 一处在请求时变化：启动时把 I18N 文案填好、压缩并编码，在 share_id 处切成前后两段
+_CHALLENGE_PAGE_PARTS = {
+    lang: tuple(
+        _minify_html(CHALLENGE_PAGE.format(lang=lang, share_id="\x00", **t)).encode("utf-8").split(b"\x00")
+    )
+    for lang, t in I18N.items()
+}
+
+
+@lru_cache(maxsize=4096)
+def _render_challenge_page(lang: str, share_id: str) -> bytes:
+    """同一 share 在有效期内会被反复打开，缓存编码好的页面 bytes"""
+    prefix, suffix = _CHALLENGE_PAGE_PARTS[lang]
+    return b"".join((prefix, share_id.encode("utf-8"), suffix))
+
+
+@lru_cache(maxsize=4096)
+def _render_challenge_page_gzip(lang: str, share_id: str) -> bytes:
+    """gzip 结果同样按 (lang, share_id) 缓存，每个 share 只压缩一次"""
+    return gzip_page(_render_challenge_page(lang, share_id))
+
+
+# 同一浏览器刷新 / 重开链接时走条件请求：ETag 带上模板指纹，部署后自动失效；
+# 只做短时 private 缓存，让过期 / 删除能在一分钟内生效
+_CHALLENGE_PAGE_VERSION = hashlib.sha1(
+    b"".join(b"".join(parts) for parts in _CHALLENGE_PAGE_PARTS.values())
+).hexdigest()[:8]
+_CHALLENGE_PAGE_CACHE_CONTROL = "private, max-age=60"
+
+
+def _challenge_page_etag(share_id: str, lang: str) -> str:
+    return f'W/"{share_id}-{lang}-{_CHALLENGE_PAGE_VERSION}"'
+
+
+# 社交平台链接预览抓取（拉 OG 信息）不算真实访问，不消耗点击次数
+_PREVIEW_BOT_RE = re.compile(
+    r"Slackbot|facebookexternalhit|Facebot|Twitterbot|WhatsApp|LinkedInBot|Discordbot|"
+    r"TelegramBot|SkypeUriPreview|Applebot|Pinterest|redditbot|Embedly|vkShare|Bytespider",
+    re.IGNORECASE,
+)
+
+
+# Accept-Language 中任一语言标签以 zh 开头（zh / zh-CN / zh-Hant-TW ...）
+_ZH_ACCEPT_LANG_RE = re.compile(r"(?:^|,)\s*zh(?![a-z])", re.IGNORECASE)
+
+
+def _is_preview_request(request: Request) -> bool:
+    return request.method == "HEAD" or bool(
+        _PREVIEW_BOT_RE.search(request.headers.get("user-agent", ""))
+    )
+
 
 # ─── Route ────────────────────────────────────────────────────────────────────
 
@@ -773,7 +840,7 @@ async def privacy_policy():
     return HTMLResponse(content=PRIVACY_PAGE.format())
 
 
-@router.get("/s/{share_id}", response_class=HTMLResponse)
+@router.api_route("/s/{share_id}", methods=["GET", "HEAD"], response_class=HTMLResponse)
 async def challenge_page(
     share_id: str,
     request: Request,
@@ -782,26 +849,42 @@ async def challenge_page(
 ):
     """
     挑战网页主入口：
+    - If-None-Match 命中且 share 仍可访问 → 304（同一浏览器重复打开，不计数）
+    - HEAD / 链接预览爬虫 → 只读查询，不计数
     - 原子性计数 + 过期检查
     - 过期 → 删除 + 返回过期页
     - 正常 → 返回挑战 HTML
     语言优先级：URL ?lang= > Accept-Language header
     """
-    share = await share_service.access_share(db, share_id)
-
-    if share is None:
-        return HTMLResponse(content=EXPIRED_PAGE, status_code=410)
-
     # 语言检测：URL 参数 > Accept-Language
     if lang not in ("zh", "en"):
         accept_lang = request.headers.get("accept-language", "")
-        lang = "zh" if "zh" in accept_lang else "en"
+        lang = "zh" if _ZH_ACCEPT_LANG_RE.search(accept_lang) else "en"
+
+    etag = _challenge_page_etag(share_id, lang)
+    cache_headers = page_cache_headers(etag, _CHALLENGE_PAGE_CACHE_CONTROL, "Accept-Language, Accept-Encoding")
+    if etag_matches(request, etag):
+        share = await share_service.get_share(db, share_id)
+        if share is not None and share.is_accessible():
+            return Response(status_code=304, headers=cache_headers)
+
+    if _is_preview_request(request):
+        share = await share_service.get_share(db, share_id)
+        if share is not None and not share.is_accessible():
+            share = None
+    else:
+        share = await share_service.access_share(db, share_id)
 
-    t = I18N[lang]
-
-    html = CHALLENGE_PAGE.format(
-        lang=lang,
-        share_id=share_id,
-        **t,
-    )
-    return HTMLResponse(content=html)
+    if share is None:
+        return HTMLResponse(
+            content=_EXPIRED_PAGE_BYTES,
+            status_code=410,
+            headers={"Cache-Control": _EXPIRED_PAGE_CACHE_CONTROL},
+        )
+
+    if accepts_gzip(request):
+        return HTMLResponse(
+            content=_render_challenge_page_gzip(lang, share_id),
+            headers={**cache_headers, "Content-Encoding": "gzip"},
+        )
+    return HTMLResponse(content=_render_challenge_page(lang, share_id), headers=cache_headers)
@@ -11,6 +11,11 @@ class Settings:
 
         # Database
         self.database_url = os.environ.get("DATABASE_URL", "")
+        # 连接池：Render Postgres 总连接数有限，按 worker 数 × (pool_size + max_overflow) 估算
+        self.db_pool_size = int(os.environ.get("DB_POOL_SIZE", "5"))
+        self.db_max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", "5"))
+        self.db_pool_recycle_s = int(os.environ.get("DB_POOL_RECYCLE_S", "1800"))
+        self.db_pool_pre_ping = os.environ.get("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes", "on")
 
         # Cloudflare R2
         self.r2_endpoint_url = os.environ.get("R2_ENDPOINT_URL", "") or os.environ.get("R2_ENDPOINT", "")
@@ -20,6 +25,9 @@ class Settings:
         # R2 公开访问 base URL（用于 DashScope voice enrollment）
         self.r2_public_base_url = os.environ.get("R2_PUBLIC_BASE_URL", "").rstrip("/")
 
+        # 阻塞调用（boto3 / pydub）所用线程池的并发上限
+        self.threadpool_size = int(os.environ.get("THREADPOOL_SIZE", "64"))
+
         # Aliyun / DashScope TTS-VC
         self.dashscope_api_key = os.environ.get("DASHSCOPE_API_KEY", "") or os.environ.get("ALIYUN_API_KEY", "")
         self.aliyun_url = os.environ.get("ALIYUN_URL", "")
@@ -28,6 +36,9 @@ class Settings:
         self.tts_model = os.environ.get("TTS_MODEL", "qwen3-tts-vc-2026-01-22")
         self.dashscope_base_http = os.environ.get("DASHSCOPE_BASE_HTTP", "https://dashscope-intl.aliyuncs.com/api/v1")
         self.dashscope_base_ws = os.environ.get("DASHSCOPE_BASE_WS", "wss://dashscope-intl.aliyuncs.com/api-ws/v1/realtime")
+        # 上游 TTS-VC 的并发 / 速率上限（每次生成 = 注册 + 合成 + 下载 + 删除）
+        self.tts_max_concurrency = int(os.environ.get("TTS_MAX_CONCURRENCY", "8"))
+        self.tts_max_rps = float(os.environ.get("TTS_MAX_RPS", "10"))
 
         # Rate limiting
         self.rate_limit_per_device = int(os.environ.get("RATE_LIMIT_PER_DEVICE", "50"))
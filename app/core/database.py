@@ -1,3 +1,4 @@
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from app.core.config import get_settings
@@ -7,12 +8,15 @@ settings = get_settings()
 # Render 注入的 DATABASE_URL 是 postgresql:// 开头，需要换成 asyncpg 驱动
 _db_url = settings.database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
 
+# pool_recycle 定期换掉长连接，代替每次 checkout 的 pre-ping（SELECT 1 多一次往返）；
+# LIFO 优先复用最近用过的连接，空闲连接自然被回收
 engine = create_async_engine(
     _db_url,
-    echo=settings.app_env == "development",
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=settings.db_pool_recycle_s,
+    pool_use_lifo=True,
 )
 
 AsyncSessionLocal = async_sessionmaker(
@@ -33,8 +37,59 @@ async def get_db():
         except Exception:
             await session.rollback()
             raise
-        finally:
-            await session.close()
+
+
+_SCHEMA_STATE_SQL = """
+SELECT
+    EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'challenges' AND column_name = 'device_id'
+    ) AS has_challenge_device_id,
+    EXISTS (
+        SELECT 1 FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema()
+          AND c.relname = 'ix_challenges_device_id_created_at' AND i.indisvalid
+    ) AS has_rate_limit_index,
+    EXISTS (
+        SELECT 1 FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema()
+          AND c.relname = 'ix_shares_active_expires_at' AND i.indisvalid
+    ) AS has_share_cleanup_index,
+    EXISTS (
+        SELECT 1 FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema()
+          AND c.relname = 'ix_shares_device_id_created_at' AND i.indisvalid
+    ) AS has_share_rate_limit_index,
+    EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'device_wallets' AND column_name = 'bonus_claims_used'
+    ) AS has_bonus_claims_used,
+    (
+        SELECT column_default FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'device_wallets' AND column_name = 'credits'
+    ) AS credits_default
+"""
+
+
+async def _create_index_concurrently(name: str, definition: str) -> None:
+    """
+    老表补建索引：CONCURRENTLY 不阻塞线上读写，但不能在事务里执行，
+    所以在 init_db 的事务之外用 autocommit 连接单独建
+    """
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        # 上次中断的构建会留下 INVALID 索引，IF NOT EXISTS 会跳过它，先删掉再重建
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        await conn.execute(text(f"CREATE INDEX CONCURRENTLY {name} {definition}"))
 
 
 async def init_db():
@@ -45,28 +100,51 @@ async def init_db():
         from app.models import unlock  # noqa: F401
         await conn.run_sync(Base.metadata.create_all)
 
+        # 老库升级补丁：先用一次只读查询确认哪些还没打，结构已是最新时不再执行任何 DDL，
+        # 避免每次启动 / 唤醒都对表加 ACCESS EXCLUSIVE 锁
+        state = (await conn.execute(text(_SCHEMA_STATE_SQL))).one()
+
         # 补齐 device_id 列（老数据库可能没有）
-        await conn.execute(
-            __import__("sqlalchemy").text(
-                "ALTER TABLE challenges ADD COLUMN IF NOT EXISTS device_id VARCHAR(64)"
+        if not state.has_challenge_device_id:
+            await conn.execute(
+                text("ALTER TABLE challenges ADD COLUMN IF NOT EXISTS device_id VARCHAR(64)")
             )
-        )
-        await conn.execute(
-            __import__("sqlalchemy").text(
-                "ALTER TABLE device_wallets ADD COLUMN IF NOT EXISTS bonus_claims_used INTEGER NOT NULL DEFAULT 0"
+        # bonus_claims_used 列 + 按旧 bonus_used 回填（只在补列时做一次）
+        if not state.has_bonus_claims_used:
+            await conn.execute(
+                text(
+                    "ALTER TABLE device_wallets ADD COLUMN IF NOT EXISTS bonus_claims_used INTEGER NOT NULL DEFAULT 0"
+                )
             )
-        )
-        await conn.execute(
-            __import__("sqlalchemy").text(
-                "ALTER TABLE device_wallets ALTER COLUMN credits SET DEFAULT 1"
+            await conn.execute(
+                text(
+                    """
+                    UPDATE device_wallets
+                    SET bonus_claims_used = 1
+                    WHERE bonus_used = true AND bonus_claims_used = 0
+                    """
+                )
             )
-        )
-        await conn.execute(
-            __import__("sqlalchemy").text(
-                """
-                UPDATE device_wallets
-                SET bonus_claims_used = 1
-                WHERE bonus_used = true AND bonus_claims_used = 0
-                """
+        if state.credits_default != "1":
+            await conn.execute(
+                text("ALTER TABLE device_wallets ALTER COLUMN credits SET DEFAULT 1")
             )
+
+    # 频率限制计数用的复合索引（老表 create_all 不会补建）
+    if not state.has_rate_limit_index:
+        await _create_index_concurrently(
+            "ix_challenges_device_id_created_at",
+            "ON challenges (device_id, created_at)",
+        )
+    # 定时清理用的部分索引（只覆盖 active share）
+    if not state.has_share_cleanup_index:
+        await _create_index_concurrently(
+            "ix_shares_active_expires_at",
+            "ON shares (expires_at) WHERE status = 'active'",
+        )
+    # share 频率限制计数用的部分索引（不含 failed）
+    if not state.has_share_rate_limit_index:
+        await _create_index_concurrently(
+            "ix_shares_device_id_created_at",
+            "ON shares (device_id, created_at) WHERE status != 'failed'",
         )
@@ -0,0 +1,40 @@
+import gzip
+from fastapi import Request
+
+
+def gzip_page(body: bytes) -> bytes:
+    """页面整体 gzip：mtime=0 保证同样输入得到同样输出，结果可直接缓存"""
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def accepts_gzip(request: Request) -> bool:
+    """
+    Accept-Encoding 协商：gzip（没写 gzip 时看 *）的 q 值大于 0 才返回压缩页面，
+    显式 gzip;q=0 表示客户端拒绝 gzip
+    """
+    wildcard = False
+    for item in request.headers.get("accept-encoding", "").lower().split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip()
+        if coding not in ("gzip", "*"):
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding == "gzip":
+            return q > 0
+        wildcard = q > 0
+    return wildcard
+
+
+def page_cache_headers(etag: str, cache_control: str, vary: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": cache_control, "Vary": vary}
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    return etag in request.headers.get("if-none-match", "")
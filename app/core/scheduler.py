@@ -1,32 +1,42 @@
+import asyncio
 import logging
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 from app.core.database import AsyncSessionLocal
 from app.services.share import cleanup_expired_shares
 
 logger = logging.getLogger(__name__)
-scheduler = AsyncIOScheduler()
+
+CLEANUP_INTERVAL_S = 30 * 60
+
+_task: asyncio.Task | None = None
 
 
 async def _cleanup_job():
     async with AsyncSessionLocal() as db:
         count = await cleanup_expired_shares(db)
         if count:
-            logger.info(f"[定时任务] 清理了 {count} 个过期 share")
+            logger.info("[定时任务] 清理了 %d 个过期 share", count)
+
+
+async def _cleanup_loop():
+    # 与原 IntervalTrigger 一致：启动后先等一个周期再跑；单个 task 串行执行，天然不会重入
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL_S)
+        try:
+            await _cleanup_job()
+        except Exception:
+            logger.exception("[定时任务] 清理过期 share 失败")
 
 
 def start_scheduler():
-    scheduler.add_job(
-        _cleanup_job,
-        trigger=IntervalTrigger(minutes=30),
-        id="cleanup_expired_shares",
-        replace_existing=True,
-        max_instances=1,
-    )
-    scheduler.start()
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_cleanup_loop(), name="cleanup_expired_shares")
     logger.info("定时清理任务已启动（每 30 分钟）")
 
 
 def stop_scheduler():
-    scheduler.shutdown(wait=False)
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
     logger.info("定时清理任务已停止")
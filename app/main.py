@@ -1,17 +1,18 @@
 import logging
 from contextlib import asynccontextmanager
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 
 from app.core.config import get_settings
 from app.core.database import init_db
 from app.core.scheduler import start_scheduler, stop_scheduler
+from app.services.tts import close_session as close_tts_session
 from app.api import share as share_router
 from app.api import webpage as webpage_router
 from app.api import challenge as challenge_router
 from app.api import unlock as unlock_router
-from app.api import privacy as privacy_router
 from app.api import client_config as client_config_router
 
 logging.basicConfig(
@@ -24,11 +25,14 @@ settings = get_settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info(f"ScamVax Backend 启动 (env={settings.app_env})")
+    logger.info("ScamVax Backend 启动 (env=%s)", settings.app_env)
+    # boto3 等阻塞调用都经 run_in_threadpool 执行，默认 40 个线程令牌会限制并发上传数
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
     await init_db()
     start_scheduler()
     yield
     stop_scheduler()
+    await close_tts_session()
     logger.info("ScamVax Backend 已关闭")
 
 
@@ -37,6 +41,7 @@ app = FastAPI(
     description="家庭防骗演习平台后端",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if settings.app_env == "development" else None,
     redoc_url=None,
 )
@@ -53,8 +58,7 @@ app.add_middleware(
 # ─── Routers ──────────────────────────────────────────────────────────────────
 app.include_router(challenge_router.router)   # POST /create_challenge, GET /c/{id}
 app.include_router(share_router.router)       # POST /api/share/create (旧接口保留)
-app.include_router(webpage_router.router)     # GET /s/{id} (旧接口保留)
-app.include_router(privacy_router.router)    # GET /privacy
+app.include_router(webpage_router.router)     # GET /s/{id} (旧接口保留), /privacy, /support
 app.include_router(unlock_router.router)      # POST /api/unlock/issue
 app.include_router(client_config_router.router)  # GET /api/client-config
 
@@ -76,8 +80,8 @@ async def app_ads_txt():
 # ─── 全局错误处理 ─────────────────────────────────────────────────────────────
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
-    logger.error(f"未处理异常: {exc}", exc_info=True)
-    return JSONResponse(
+    logger.error("未处理异常: %s", exc, exc_info=True)
+    return ORJSONResponse(
         status_code=500,
         content={"error_code": "INTERNAL_ERROR", "message": "服务器内部错误"},
     )
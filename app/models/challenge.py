@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import String, DateTime, func
+from sqlalchemy import String, DateTime, Index, func
 from sqlalchemy.orm import Mapped, mapped_column
 from app.core.database import Base
 
@@ -11,8 +11,13 @@ class Challenge(Base):
     fake_url TEXT NOT NULL
     device_id TEXT  (App 设备 ID，用于频率限制)
     created_at TIMESTAMP DEFAULT NOW()
+
+    INDEX (device_id, created_at)  -- 频率限制按设备 + 时间窗口计数
     """
     __tablename__ = "challenges"
+    __table_args__ = (
+        Index("ix_challenges_device_id_created_at", "device_id", "created_at"),
+    )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     fake_url: Mapped[str] = mapped_column(String(512), nullable=False)
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy import String, Integer, DateTime, Enum as SAEnum, func
+from sqlalchemy import String, Integer, DateTime, Enum as SAEnum, Index, func, text
 from sqlalchemy.orm import Mapped, mapped_column
 from app.core.database import Base
 import enum
@@ -19,6 +19,21 @@ def generate_share_id() -> str:
 
 class Share(Base):
     __tablename__ = "shares"
+    __table_args__ = (
+        # 定时清理只扫 active 中已到期的行：部分索引只覆盖 active share
+        Index(
+            "ix_shares_active_expires_at",
+            "expires_at",
+            postgresql_where=text("status = 'active'"),
+        ),
+        # 频率限制按设备 + 时间窗口计数（不计 failed）
+        Index(
+            "ix_shares_device_id_created_at",
+            "device_id",
+            "created_at",
+            postgresql_where=text("status != 'failed'"),
+        ),
+    )
 
     share_id: Mapped[str] = mapped_column(
         String(16), primary_key=True, default=generate_share_id
@@ -1,5 +1,10 @@
 import io
 import logging
+import shutil
+import struct
+import subprocess
+from functools import lru_cache
+from starlette.datastructures import UploadFile
 
 logger = logging.getLogger(__name__)
 
@@ -39,13 +44,38 @@ MIME_TO_EXT = {
 }
 
 
+# convert_to_wav 的目标格式：PCM16, 24kHz, Mono
+TARGET_SAMPLE_RATE = 24000
+TARGET_CHANNELS = 1
+TARGET_SAMPLE_WIDTH = 2
+
+# ffmpeg 从 pipe 读输入时无法 seek，moov 可能在文件尾的 MP4 系容器仍走 pydub（临时文件）
+_NON_STREAMABLE_FORMATS = {"m4a", "aac", "mp4", "3gp"}
+_FFMPEG_TIMEOUT_S = 30
+
+
 class AudioProcessingError(Exception):
     def __init__(self, error_code: str, message: str):
         self.error_code = error_code
         super().__init__(message)
 
 
-def _detect_format(raw_bytes: bytes, filename: str = "", content_type: str = "") -> str:
+_UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+async def read_upload_limited(upload: UploadFile, max_bytes: int) -> bytearray:
+    """分块读取上传文件到 bytearray，累计超过 max_bytes 立即抛 FILE_TOO_LARGE，不再读取剩余部分"""
+    buf = bytearray()
+    while chunk := await upload.read(_UPLOAD_CHUNK_SIZE):
+        buf.extend(chunk)
+        if len(buf) > max_bytes:
+            raise AudioProcessingError(
+                "FILE_TOO_LARGE", f"文件超过 {max_bytes // (1024 * 1024)}MB 限制"
+            )
+    return buf
+
+
+def _detect_format(raw_bytes: bytes | bytearray, filename: str = "", content_type: str = "") -> str:
     """
     推断音频格式，优先级：
     1. 文件头魔术字节（最可靠）
@@ -83,19 +113,107 @@ def _detect_format(raw_bytes: bytes, filename: str = "", content_type: str = "")
     return "wav"  # 默认
 
 
-def convert_to_wav(raw_bytes: bytes, filename: str = "", content_type: str = "") -> bytes:
+def _is_target_wav(raw_bytes: bytes | bytearray) -> bool:
+    """
+    只解析 RIFF 头判断是否已是目标格式（PCM16 / 24kHz / 单声道）的 WAV。
+    RIFF / data chunk 长度字段必须与实际字节数一致——部分 Android 录音长度字段有误，
+    这类文件仍需重新编码修复。
+    """
+    total = len(raw_bytes)
+    if total < 12 or raw_bytes[:4] != b"RIFF" or raw_bytes[8:12] != b"WAVE":
+        return False
+    if struct.unpack_from("<I", raw_bytes, 4)[0] != total - 8:
+        return False
+
+    fmt_ok = False
+    offset = 12
+    while offset + 8 <= total:
+        chunk_id = raw_bytes[offset:offset + 4]
+        chunk_size = struct.unpack_from("<I", raw_bytes, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 16 or body + 16 > total:
+                return False
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", raw_bytes, body)
+            fmt_ok = (
+                format_tag == 1
+                and channels == TARGET_CHANNELS
+                and sample_rate == TARGET_SAMPLE_RATE
+                and bits == TARGET_SAMPLE_WIDTH * 8
+            )
+            if not fmt_ok:
+                return False
+        elif chunk_id == b"data":
+            return fmt_ok and body + chunk_size == total
+        offset = body + chunk_size + (chunk_size & 1)
+    return False
+
+
+@lru_cache(maxsize=1)
+def _ffmpeg_path() -> str | None:
+    return shutil.which("ffmpeg")
+
+
+def _build_wav(pcm: bytes) -> bytes:
+    """给裸 PCM16 数据加上 44 字节 WAV 头（ffmpeg 写 pipe 时无法回填长度字段，自己拼）"""
+    block_align = TARGET_CHANNELS * TARGET_SAMPLE_WIDTH
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(pcm), b"WAVE",
+        b"fmt ", 16, 1, TARGET_CHANNELS, TARGET_SAMPLE_RATE,
+        TARGET_SAMPLE_RATE * block_align, block_align, TARGET_SAMPLE_WIDTH * 8,
+        b"data", len(pcm),
+    )
+    return header + pcm
+
+
+def _convert_via_ffmpeg(ffmpeg: str, raw_bytes: bytes | bytearray, fmt: str) -> bytes:
+    """stdin → ffmpeg → stdout 直接转成 PCM16 / 24kHz / 单声道，不落临时文件"""
+    cmd = [
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-threads", "0",
+        "-i", "pipe:0",
+        "-vn", "-ac", str(TARGET_CHANNELS), "-ar", str(TARGET_SAMPLE_RATE),
+        "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1",
+    ]
+    try:
+        proc = subprocess.run(cmd, input=raw_bytes, capture_output=True, timeout=_FFMPEG_TIMEOUT_S)
+    except subprocess.TimeoutExpired:
+        logger.error(f"ffmpeg 转换超时 ({fmt})")
+        raise AudioProcessingError("AUDIO_CONVERT_FAILED", f"无法处理音频格式 {fmt}，请上传 WAV/MP3/M4A 格式的录音")
+
+    if proc.returncode != 0 or not proc.stdout:
+        logger.error(f"音频格式转换失败 ({fmt}): {proc.stderr.decode(errors='replace').strip()}")
+        raise AudioProcessingError("AUDIO_CONVERT_FAILED", f"无法处理音频格式 {fmt}，请上传 WAV/MP3/M4A 格式的录音")
+
+    wav_bytes = _build_wav(proc.stdout)
+    logger.info(f"格式转换成功: {fmt} → wav，原始 {len(raw_bytes)} bytes → {len(wav_bytes)} bytes")
+    return wav_bytes
+
+
+def convert_to_wav(
+    raw_bytes: bytes | bytearray, filename: str = "", content_type: str = ""
+) -> bytes | bytearray:
     """
     将任意格式音频转换为 WAV (PCM16, 24kHz, Mono)。
-    如果已经是 WAV 直接返回（节省 CPU）。
-    依赖 pydub + ffmpeg（Render 环境默认带 ffmpeg）。
+    如果已经是头部正确的目标格式 WAV 直接返回原 buffer（不转换也不拷贝）。
+    依赖 ffmpeg（Render 环境默认带 ffmpeg），MP4 系容器经 pydub 调用。
     """
     if len(raw_bytes) < 500:
         raise AudioProcessingError("AUDIO_TOO_SHORT", "音频文件太小，请重新录音")
 
+    if _is_target_wav(raw_bytes):
+        logger.info(f"已是目标格式 WAV，跳过转换 ({len(raw_bytes)} bytes)")
+        return raw_bytes
+
     fmt = _detect_format(raw_bytes, filename, content_type)
     logger.info(f"检测到音频格式: {fmt} (filename={filename}, content_type={content_type})")
 
-    # 使用 pydub 转换（WAV 也经过重新编码，修复 Android 录音 data chunk size 错误问题）
+    # 可流式解码的格式直接走 ffmpeg 管道（WAV 也经过重新编码，修复 Android 录音 data chunk size 错误问题）
+    ffmpeg = _ffmpeg_path()
+    if ffmpeg and fmt not in _NON_STREAMABLE_FORMATS:
+        return _convert_via_ffmpeg(ffmpeg, raw_bytes, fmt)
+
+    # 其余格式使用 pydub 转换
     try:
         from pydub import AudioSegment
     except ImportError:
@@ -107,7 +225,11 @@ def convert_to_wav(raw_bytes: bytes, filename: str = "", content_type: str = "")
         audio = AudioSegment.from_file(io.BytesIO(raw_bytes), format=pydub_fmt)
 
         # 标准化：单声道、24kHz、16bit
-        audio = audio.set_channels(1).set_frame_rate(24000).set_sample_width(2)
+        audio = (
+            audio.set_channels(TARGET_CHANNELS)
+            .set_frame_rate(TARGET_SAMPLE_RATE)
+            .set_sample_width(TARGET_SAMPLE_WIDTH)
+        )
 
         out_buf = io.BytesIO()
         audio.export(out_buf, format="wav")
@@ -1,8 +1,10 @@
+import asyncio
 import logging
 from datetime import datetime, timezone, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, and_
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, update, and_, exists, func, text, true
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from starlette.concurrency import run_in_threadpool
 from app.core.config import get_settings
 from app.models.share import Share, ShareStatus, generate_share_id
@@ -11,6 +13,17 @@ from app.services import storage
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# 定时清理每批处理的 share 数（与 R2 DeleteObjects 单次上限一致）
+CLEANUP_BATCH_SIZE = 1000
+
+# 部分索引的谓词在查询里写成字面量：asyncpg 走预编译语句，切到通用计划后，
+# 绑定参数形式的 status 条件无法被证明蕴含索引谓词，部分索引就用不上
+_STATUS_ACTIVE = text("shares.status = 'active'")
+_STATUS_NOT_FAILED = text("shares.status != 'failed'")
+
+# 后台 R2 删除 task 的强引用，避免未完成就被 GC
+_background_tasks: set[asyncio.Task] = set()
+
 
 # ─── 创建 ────────────────────────────────────────────────────────────────────
 
@@ -24,86 +37,119 @@ async def create_share(
 ) -> Share:
     """
     创建新 Share：
-    1. 生成 share_id
+    1. 生成 share_id，INSERT ... ON CONFLICT DO NOTHING 预占行（冲突只重试插入，不浪费上传）
     2. 上传 AI 音频到 R2
-    3. 写入数据库
+    3. 提交事务（上传失败则回滚，预占行不会落库）
     """
     expires_at = datetime.now(timezone.utc) + timedelta(hours=settings.share_ttl_hours)
 
+    share = None
     for attempt in range(3):
         share_id = generate_share_id()
-
-        # 上传音频（先传，传失败就不写 DB）
-        try:
-            audio_key = await run_in_threadpool(storage.upload_audio, share_id, ai_audio_bytes)
-        except Exception as e:
-            logger.error(f"音频上传失败: {e}")
-            raise
-
-        share = Share(
-            share_id=share_id,
-            device_id=device_id,
-            expires_at=expires_at,
-            click_count=0,
-            max_clicks=settings.share_max_clicks,
-            status=ShareStatus.active,
-            ai_audio_key=audio_key,
-            lang=lang,
-            platform=platform,
-            region=region,
-            script_version="v1",
+        stmt = (
+            pg_insert(Share)
+            .values(
+                share_id=share_id,
+                device_id=device_id,
+                expires_at=expires_at,
+                click_count=0,
+                max_clicks=settings.share_max_clicks,
+                status=ShareStatus.active,
+                ai_audio_key=storage.get_fake_url(share_id),
+                lang=lang,
+                platform=platform,
+                region=region,
+                script_version="v1",
+            )
+            .on_conflict_do_nothing(index_elements=[Share.share_id])
+            .returning(Share)
         )
-        db.add(share)
-        try:
-            await db.commit()
-            await db.refresh(share)
-            return share
-        except IntegrityError:
-            await db.rollback()
-            await run_in_threadpool(storage.delete_audio, share_id)
-            if attempt == 2:
-                raise RuntimeError("share_id 冲突，无法创建 Share，请重试")
-            logger.warning(f"share_id 冲突，重新生成 (attempt {attempt + 1})")
+        share = (await db.execute(stmt)).scalars().first()
+        if share is not None:
+            break
+        logger.warning("share_id 冲突，重新生成 (attempt %d)", attempt + 1)
+
+    if share is None:
+        await db.rollback()
+        raise RuntimeError("share_id 冲突，无法创建 Share，请重试")
+
+    # 上传音频（行已预占但未提交，传失败直接回滚）
+    try:
+        await run_in_threadpool(storage.upload_audio, share.share_id, ai_audio_bytes)
+    except Exception as e:
+        logger.error("音频上传失败: %s", e, exc_info=True)
+        await db.rollback()
+        raise
+
+    await db.commit()
+    return share
 
 
 # ─── 访问（计数 + 过期检查） ────────────────────────────────────────────────
 
 async def access_share(db: AsyncSession, share_id: str) -> Share | None:
     """
-    访问 share：
-    - 原子性递增 click_count
-    - 检查是否过期
-    - 若过期，触发销毁并返回 None
+    访问 share（单条语句、一次往返）：
+    - hit：原子性递增 click_count，过期条件直接写进 WHERE
+    - expired：hit 未命中且 share 仍为 active（即已过期）→ 同一语句内标记 deleted
+    - 抢到 expired 的请求在后台删除 R2 音频，返回 None
     """
-    # 原子性 UPDATE + 获取最新数据（防并发竞态）
-    stmt = (
+    now = datetime.now(timezone.utc)
+    # 与 Share.is_expired 一致：递增后 click_count 达到 max_clicks 即视为过期
+    hit = (
         update(Share)
         .where(
             and_(
                 Share.share_id == share_id,
                 Share.status == ShareStatus.active,
+                Share.click_count + 1 < Share.max_clicks,
+                Share.expires_at > now,
             )
         )
         .values(click_count=Share.click_count + 1)
-        .returning(Share)
+        .returning(*Share.__table__.c)
+        .cte("hit")
     )
+    expired = (
+        update(Share)
+        .where(
+            and_(
+                Share.share_id == share_id,
+                Share.status == ShareStatus.active,
+                ~exists(select(hit.c.share_id)),
+            )
+        )
+        .values(status=ShareStatus.deleted)
+        .returning(Share.share_id)
+        .cte("expired")
+    )
+    flag = select(exists(select(expired.c.share_id)).label("expired")).subquery("flag")
+    stmt = select(flag.c.expired, aliased(Share, hit)).select_from(flag).outerjoin(hit, true())
+
     result = await db.execute(stmt)
+    is_expired, share = result.one()
     await db.commit()
-    share = result.scalars().first()
 
-    if share is None:
-        # share 不存在或已删除
-        return None
-
-    # 检查是否已过期
-    if share.is_expired():
-        logger.info(f"Share {share_id} 已过期，触发销毁")
-        await delete_share(db, share_id)
-        return None
+    if is_expired:
+        logger.info("Share %s 已过期，触发销毁", share_id)
+        task = asyncio.create_task(_delete_audio_in_background(share_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
 
     return share
 
 
+async def _delete_audio_in_background(share_id: str) -> None:
+    # delete_audio 只吞 ClientError，连接/超时等异常在这里兜住，否则只会变成无归属的 "Task exception was never retrieved"
+    try:
+        audio_deleted = await run_in_threadpool(storage.delete_audio, share_id)
+    except Exception:
+        logger.exception("R2 音频后台删除异常: %s", share_id)
+        return
+    if not audio_deleted:
+        logger.warning("R2 音频删除失败或不存在: %s", share_id)
+
+
 async def get_share(db: AsyncSession, share_id: str) -> Share | None:
     """不计数，仅查询（用于音频接口）"""
     result = await db.execute(
@@ -114,30 +160,6 @@ async def get_share(db: AsyncSession, share_id: str) -> Share | None:
 
 # ─── 销毁 ────────────────────────────────────────────────────────────────────
 
-async def delete_share(db: AsyncSession, share_id: str) -> bool:
-    """
-    完整销毁流程：
-    1. 删除 R2 音频
-    2. 更新 DB status = deleted
-    """
-    # 删除 R2 音频
-    audio_deleted = await run_in_threadpool(storage.delete_audio, share_id)
-    if not audio_deleted:
-        logger.warning(f"R2 音频删除失败或不存在: {share_id}")
-
-    # 更新 DB
-    stmt = (
-        update(Share)
-        .where(Share.share_id == share_id)
-        .values(status=ShareStatus.deleted)
-    )
-    await db.execute(stmt)
-    await db.commit()
-
-    logger.info(f"Share {share_id} 已完整销毁")
-    return True
-
-
 async def mark_failed(db: AsyncSession, share_id: str) -> None:
     """标记为失败（生成过程异常回滚用）"""
     stmt = (
@@ -153,27 +175,53 @@ async def mark_failed(db: AsyncSession, share_id: str) -> None:
 
 async def cleanup_expired_shares(db: AsyncSession) -> int:
     """
-    定时任务：扫描并销毁所有过期的 active share
+    定时任务：分批扫描并销毁所有过期的 active share
+    每批：一次 SELECT 取 share_id → 一次 UPDATE + commit → 一次 R2 DeleteObjects
     返回清理数量
     """
-    now = datetime.now(timezone.utc)
-    result = await db.execute(
-        select(Share).where(
-            and_(
-                Share.status == ShareStatus.active,
-                Share.expires_at <= now,
+    count = 0
+    while True:
+        now = datetime.now(timezone.utc)
+        result = await db.execute(
+            select(Share.share_id)
+            .where(
+                and_(
+                    _STATUS_ACTIVE,
+                    Share.expires_at <= now,
+                )
             )
+            .limit(CLEANUP_BATCH_SIZE)
         )
-    )
-    expired = result.scalars().all()
+        share_ids = list(result.scalars().all())
+        if not share_ids:
+            break
+
+        # 先提交状态翻转再删 R2：否则删除到提交之间，仍是 active 的 share 会被 307 到已删除的对象
+        result = await db.execute(
+            update(Share)
+            .where(
+                and_(
+                    Share.share_id.in_(share_ids),
+                    Share.status == ShareStatus.active,
+                )
+            )
+            .values(status=ShareStatus.deleted)
+            .returning(Share.share_id)
+        )
+        deleted_ids = list(result.scalars().all())
+        await db.commit()
 
-    count = 0
-    for share in expired:
-        await delete_share(db, share.share_id)
-        count += 1
+        if deleted_ids:
+            failed = await run_in_threadpool(storage.delete_audios, deleted_ids)
+            if failed:
+                logger.warning("定时清理：%d 个 R2 音频删除失败或不存在", failed)
+        count += len(deleted_ids)
+
+        if len(share_ids) < CLEANUP_BATCH_SIZE:
+            break
 
     if count:
-        logger.info(f"定时清理：销毁了 {count} 个过期 share")
+        logger.info("定时清理：销毁了 %d 个过期 share", count)
     return count
 
 
@@ -188,13 +236,13 @@ async def check_rate_limit(db: AsyncSession, device_id: str) -> bool:
         seconds=settings.rate_limit_window_seconds
     )
     result = await db.execute(
-        select(Share).where(
+        select(func.count()).select_from(Share).where(
             and_(
                 Share.device_id == device_id,
                 Share.created_at >= window_start,
-                Share.status != ShareStatus.failed,
+                _STATUS_NOT_FAILED,
             )
         )
     )
-    recent_count = len(result.scalars().all())
+    recent_count = result.scalar_one()
     return recent_count < settings.rate_limit_per_device
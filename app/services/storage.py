@@ -1,20 +1,51 @@
+import io
 import logging
+import threading
+from typing import BinaryIO
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from app.core.config import get_settings
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# 超过阈值的音频改走 multipart 并行分片上传（R2 要求除最后一片外分片大小一致）
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_THRESHOLD,
+    max_concurrency=8,
+    use_threads=True,
+)
+
+
+_client = None
+_client_lock = threading.Lock()
+
 
 def _get_client():
-    return boto3.client(
-        "s3",
-        endpoint_url=settings.get_r2_endpoint(),
-        aws_access_key_id=settings.get_r2_access_key(),
-        aws_secret_access_key=settings.get_r2_secret_key(),
-        region_name="auto",
-    )
+    """
+    进程内共享一个 S3 client（boto3 client 线程安全），复用连接池，
+    避免每次调用都重新建 client + TLS 握手。连接池大小与线程池上限一致。
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = boto3.session.Session().client(
+                    "s3",
+                    endpoint_url=settings.get_r2_endpoint(),
+                    aws_access_key_id=settings.get_r2_access_key(),
+                    aws_secret_access_key=settings.get_r2_secret_key(),
+                    region_name="auto",
+                    config=Config(
+                        max_pool_connections=settings.threadpool_size,
+                        tcp_keepalive=True,
+                    ),
+                )
+    return _client
 
 
 def get_audio_key(challenge_id: str) -> str:
@@ -28,13 +59,16 @@ def get_fake_url(challenge_id: str) -> str:
     return f"{public_base}/{key}"
 
 
-def upload_raw(key: str, audio_bytes: bytes) -> str:
-    """上传原始音频到 R2，返回公开访问 URL（用于 DashScope enrollment）"""
+def upload_raw(key: str, body: bytes | BinaryIO) -> str:
+    """
+    上传原始音频到 R2，返回公开访问 URL（用于 DashScope enrollment）
+    body 可以是 bytes，也可以是文件对象（流式上传，不整体读入内存）
+    """
     client = _get_client()
     client.put_object(
         Bucket=settings.get_r2_bucket(),
         Key=key,
-        Body=audio_bytes,
+        Body=body,
         ContentType="audio/wav",
     )
     public_base = settings.r2_public_base_url
@@ -56,17 +90,33 @@ def delete_by_key(key: str) -> bool:
 
 
 def upload_audio(challenge_id: str, audio_bytes: bytes) -> str:
-    """上传 fake 音频到 R2，返回公开访问 URL"""
+    """
+    上传 fake 音频到 R2，返回公开访问 URL
+    小文件单次 PUT；超过 MULTIPART_THRESHOLD 时 multipart 分片并行上传
+    """
     client = _get_client()
     key = get_audio_key(challenge_id)
-
-    client.put_object(
-        Bucket=settings.get_r2_bucket(),
-        Key=key,
-        Body=audio_bytes,
-        ContentType="audio/wav",
-        CacheControl="public, max-age=31536000, immutable",
-    )
+    extra_args = {
+        "ContentType": "audio/wav",
+        "CacheControl": "public, max-age=31536000, immutable",
+    }
+
+    if len(audio_bytes) > MULTIPART_THRESHOLD:
+        # upload_fileobj 负责 create/upload_part/complete，失败时自动 abort
+        client.upload_fileobj(
+            io.BytesIO(audio_bytes),
+            settings.get_r2_bucket(),
+            key,
+            ExtraArgs=extra_args,
+            Config=_TRANSFER_CONFIG,
+        )
+    else:
+        client.put_object(
+            Bucket=settings.get_r2_bucket(),
+            Key=key,
+            Body=audio_bytes,
+            **extra_args,
+        )
     url = get_fake_url(challenge_id)
     logger.info(f"已上传音频: {key} -> {url}")
     return url
@@ -86,26 +136,6 @@ def download_audio(challenge_id: str) -> bytes:
         raise
 
 
-def stream_audio(challenge_id: str):
-    """流式读取 fake 音频（生成器）"""
-    client = _get_client()
-    key = get_audio_key(challenge_id)
-
-    try:
-        response = client.get_object(Bucket=settings.get_r2_bucket(), Key=key)
-        body = response["Body"]
-        chunk_size = 65536  # 64KB
-        while True:
-            chunk = body.read(chunk_size)
-            if not chunk:
-                break
-            yield chunk
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "NoSuchKey":
-            raise FileNotFoundError(f"音频不存在: {key}")
-        raise
-
-
 def delete_audio(challenge_id: str) -> bool:
     """从 R2 删除 fake 音频，返回是否成功"""
     client = _get_client()
@@ -120,13 +150,26 @@ def delete_audio(challenge_id: str) -> bool:
         return False
 
 
-def audio_exists(challenge_id: str) -> bool:
-    """检查音频是否存在"""
+def delete_audios(challenge_ids: list[str]) -> int:
+    """批量删除 fake 音频（单次 DeleteObjects 最多 1000 个 key），返回删除失败的数量"""
+    if not challenge_ids:
+        return 0
     client = _get_client()
-    key = get_audio_key(challenge_id)
 
     try:
-        client.head_object(Bucket=settings.get_r2_bucket(), Key=key)
-        return True
-    except ClientError:
-        return False
+        response = client.delete_objects(
+            Bucket=settings.get_r2_bucket(),
+            Delete={
+                "Objects": [{"Key": get_audio_key(cid)} for cid in challenge_ids],
+                "Quiet": True,
+            },
+        )
+    except ClientError as e:
+        logger.error(f"批量删除音频失败 ({len(challenge_ids)} 个): {e}")
+        return len(challenge_ids)
+
+    errors = response.get("Errors", [])
+    for err in errors:
+        logger.error(f"删除音频失败 {err.get('Key')}: {err.get('Code')} {err.get('Message')}")
+    logger.info(f"已批量删除音频: {len(challenge_ids) - len(errors)} 个")
+    return len(errors)
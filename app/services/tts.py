@@ -1,9 +1,12 @@
+import asyncio
 import base64
-import json
+import hashlib
 import logging
 import re
 import uuid
 import aiohttp
+import orjson
+from starlette.concurrency import run_in_threadpool
 from app.core.config import get_settings
 
 logger = logging.getLogger(__name__)
@@ -22,13 +25,60 @@ TTS_MODEL = settings.tts_model
 ENROLL_MODEL = settings.voice_enroll_model
 
 
+# 上游限流：信号量限制同时在途的生成数，令牌间隔限制每秒发起数
+_TTS_SEMAPHORE = asyncio.Semaphore(settings.tts_max_concurrency)
+_tts_rate_lock = asyncio.Lock()
+_tts_next_slot = 0.0
+
+# 单飞：相同（源音频, 文案）的并发生成只打一次上游，其余调用等待同一个 task
+_INFLIGHT: dict[bytes, asyncio.Task] = {}
+
+
 class TTSVCError(Exception):
     pass
 
 
+# 进程内共享一个 aiohttp session：复用到 DashScope / OSS 的 TCP + TLS 连接，关停时关闭
+_session: aiohttp.ClientSession | None = None
+
+
+def _orjson_dumps(obj) -> str:
+    return orjson.dumps(obj).decode()
+
+
+def _get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60),
+            json_serialize=_orjson_dumps,
+        )
+    return _session
+
+
+async def close_session() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def _wait_rate_slot() -> None:
+    """按 TTS_MAX_RPS 均匀排队发起请求，超出速率的调用在此等待"""
+    global _tts_next_slot
+    if settings.tts_max_rps <= 0:
+        return
+    async with _tts_rate_lock:
+        now = asyncio.get_running_loop().time()
+        delay = _tts_next_slot - now
+        _tts_next_slot = max(now, _tts_next_slot) + 1 / settings.tts_max_rps
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
 def _format_dashscope_error(resp_text: str) -> str:
     try:
-        data = json.loads(resp_text)
+        data = orjson.loads(resp_text)
     except Exception:
         return resp_text
 
@@ -49,13 +99,17 @@ def _validate_tts_settings() -> None:
         raise TTSVCError("缺少 VOICE_ENROLL_MODEL 配置")
 
 
-async def enroll_voice(audio_bytes: bytes) -> str:
+def _to_data_uri(audio_bytes: bytes | bytearray) -> str:
+    return "data:audio/wav;base64," + base64.b64encode(audio_bytes).decode()
+
+
+async def enroll_voice(audio_bytes: bytes | bytearray) -> str:
     """
     音色注册：传 base64 音频，返回 voice_name
     端点: POST /services/audio/tts/customization
     """
-    audio_b64 = base64.b64encode(audio_bytes).decode()
-    data_uri = f"data:audio/wav;base64,{audio_b64}"
+    # ~1MB 音频的 base64 编码 + 拼接放到线程池，不占用事件循环
+    data_uri = await run_in_threadpool(_to_data_uri, audio_bytes)
 
     headers = {
         "Authorization": f"Bearer {settings.dashscope_api_key}",
@@ -65,13 +119,12 @@ async def enroll_voice(audio_bytes: bytes) -> str:
     name_candidates = [f"sv{uuid.uuid4().hex[:14]}", uuid.uuid4().hex[:16]]
 
     async def _post_create(input_payload: dict) -> tuple[int, str]:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                ENROLL_URL,
-                headers=headers,
-                json={"model": ENROLL_MODEL, "input": input_payload},
-            ) as resp:
-                return resp.status, await resp.text()
+        async with _get_session().post(
+            ENROLL_URL,
+            headers=headers,
+            json={"model": ENROLL_MODEL, "input": input_payload},
+        ) as resp:
+            return resp.status, await resp.text()
 
     logger.info("开始 voice enrollment...")
     last_error = ""
@@ -86,7 +139,7 @@ async def enroll_voice(audio_bytes: bytes) -> str:
         }
         status, text = await _post_create(input_payload)
         if status == 200:
-            data = json.loads(text)
+            data = orjson.loads(text)
             break
         logger.warning(
             "Voice enrollment 使用 preferred_name=%s 失败 %s: %s",
@@ -105,7 +158,7 @@ async def enroll_voice(audio_bytes: bytes) -> str:
         }
         status, text = await _post_create(input_payload)
         if status == 200:
-            data = json.loads(text)
+            data = orjson.loads(text)
         else:
             logger.error("Voice enrollment 失败 %s: %s", status, text)
             last_error = f"HTTP {status} - {_format_dashscope_error(text)}"
@@ -137,19 +190,18 @@ async def delete_voice(voice_name: str) -> None:
         },
     }
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(ENROLL_URL, headers=headers, json=payload) as resp:
-                text = await resp.text()
-                if resp.status != 200:
-                    logger.warning(f"Voice 删除失败 {resp.status}: {text}，voice={voice_name}")
-                else:
-                    logger.info(f"Voice 删除成功，voice={voice_name}")
+        async with _get_session().post(ENROLL_URL, headers=headers, json=payload) as resp:
+            text = await resp.text()
+            if resp.status != 200:
+                logger.warning(f"Voice 删除失败 {resp.status}: {text}，voice={voice_name}")
+            else:
+                logger.info(f"Voice 删除成功，voice={voice_name}")
     except Exception as e:
         logger.warning(f"Voice 删除异常（已忽略）: {e}，voice={voice_name}")
 
 
 async def generate_ai_audio(
-    audio_bytes: bytes,
+    audio_bytes: bytes | bytearray,
     lang: str = "zh",
     text: str | None = None,
 ) -> bytes:
@@ -161,21 +213,46 @@ async def generate_ai_audio(
     4. 删除临时音色（释放账户配额）
     """
     _validate_tts_settings()
+    script = _resolve_script(text=text, lang=lang)
+    key = hashlib.blake2b(audio_bytes, digest_size=16)
+    key.update(script.encode())
+    key = key.digest()
+
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_generate(audio_bytes, script))
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda t: _forget_inflight(key, t))
+    else:
+        logger.info("相同音频 + 文案的生成正在进行，复用在途请求")
+    # shield：单个请求断开 / 取消不影响其他等待同一结果的请求
+    return await asyncio.shield(task)
+
+
+def _forget_inflight(key: bytes, task: asyncio.Task) -> None:
+    _INFLIGHT.pop(key, None)
+    # 所有等待者都已取消时，取一次异常，避免 "Task exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+async def _generate(audio_bytes: bytes | bytearray, script: str) -> bytes:
     logger.info(
         "TTS 配置: base=%s, tts_model=%s, enroll_model=%s",
         BASE_HTTP,
         TTS_MODEL,
         ENROLL_MODEL,
     )
-    voice_name = await enroll_voice(audio_bytes)
-    try:
-        script = _resolve_script(text=text, lang=lang)
-        ai_audio = await _tts_via_http(voice_name, script)
-        logger.info(f"AI 音频生成完成，大小={len(ai_audio)} bytes")
-        return ai_audio
-    finally:
-        # 无论成功还是失败都删除临时音色，避免消耗账户 1000 条配额
-        await delete_voice(voice_name)
+    async with _TTS_SEMAPHORE:
+        await _wait_rate_slot()
+        voice_name = await enroll_voice(audio_bytes)
+        try:
+            ai_audio = await _tts_via_http(voice_name, script)
+            logger.info(f"AI 音频生成完成，大小={len(ai_audio)} bytes")
+            return ai_audio
+        finally:
+            # 无论成功还是失败都删除临时音色，避免消耗账户 1000 条配额
+            await delete_voice(voice_name)
 
 
 def _resolve_script(text: str | None, lang: str) -> str:
@@ -208,24 +285,23 @@ async def _tts_via_http(voice_name: str, text: str) -> bytes:
     }
 
     logger.info(f"开始 HTTP TTS 合成，voice={voice_name}")
-    async with aiohttp.ClientSession() as session:
-        async with session.post(SYNTHESIS_URL, headers=headers, json=payload) as resp:
-            resp_text = await resp.text()
-            if resp.status != 200:
-                logger.error(f"TTS HTTP 合成失败 {resp.status}: {resp_text}")
-                raise TTSVCError(f"TTS 合成失败: HTTP {resp.status} - {_format_dashscope_error(resp_text)}")
-            data = json.loads(resp_text)
+    session = _get_session()
+    async with session.post(SYNTHESIS_URL, headers=headers, json=payload) as resp:
+        resp_text = await resp.text()
+        if resp.status != 200:
+            logger.error(f"TTS HTTP 合成失败 {resp.status}: {resp_text}")
+            raise TTSVCError(f"TTS 合成失败: HTTP {resp.status} - {_format_dashscope_error(resp_text)}")
+        data = orjson.loads(resp_text)
 
     audio_url = data.get("output", {}).get("audio", {}).get("url")
     if not audio_url:
         raise TTSVCError(f"响应中未找到音频 URL: {data}")
 
     logger.info(f"TTS 合成成功，下载音频: {audio_url[:80]}...")
-    async with aiohttp.ClientSession() as session:
-        async with session.get(audio_url) as resp:
-            if resp.status != 200:
-                raise TTSVCError(f"音频下载失败: HTTP {resp.status}")
-            audio_bytes = await resp.read()
+    async with session.get(audio_url) as resp:
+        if resp.status != 200:
+            raise TTSVCError(f"音频下载失败: HTTP {resp.status}")
+        audio_bytes = await resp.read()
 
     logger.info(f"音频下载完成，大小={len(audio_bytes)} bytes")
     return audio_bytes
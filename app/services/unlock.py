@@ -1,18 +1,29 @@
 import base64
-import hashlib
 import hmac
 import json
+import os
+import re
 import time
-import uuid
-from sqlalchemy import select, text
+from collections import OrderedDict
+from functools import lru_cache
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import get_settings
-from app.models.unlock import DeviceWallet, UnlockTokenUse
+from app.models.unlock import DeviceWallet
 
 settings = get_settings()
 _TOKEN_TTL_SECONDS = 10 * 60
 _METHODS = {"CREDIT", "BONUS"}
 _BONUS_LEVEL_INTERVAL = 10
+_JTI_RE = re.compile(r"\A[0-9a-f]{32}\Z")
+# 密钥只编码一次；签名走 hmac.digest 的 C 实现一次性计算
+_SECRET = settings.secret_key.encode("utf-8")
+
+# 本进程已确认被使用过的 jti → exp（按写入顺序的有界 FIFO），重放请求直接拒绝，不再查库
+# 只在数据库确认冲突后写入（成功消费可能随调用方回滚而撤销）；跨进程仍以主键约束为准
+_USED_JTI_CACHE_SIZE = 65_536
+_used_jtis: OrderedDict[str, int] = OrderedDict()
 
 
 class UnlockError(Exception):
@@ -23,40 +34,49 @@ class UnlockError(Exception):
         super().__init__(message)
 
 
+_SIG_LEN = 43
+# 按 len % 4 查表补齐 base64 填充
+_PAD = ("", "===", "==", "=")
+
+
 def _b64url_encode(raw: bytes) -> str:
+    # SHA-256 摘要恒为 32 字节 → 43 字符 + 1 个填充，直接切片
+    if len(raw) == 32:
+        return base64.urlsafe_b64encode(raw)[:43].decode("ascii")
     return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
 
 
 def _b64url_decode(raw: str) -> bytes:
-    padding = "=" * (-len(raw) % 4)
-    return base64.urlsafe_b64decode(raw + padding)
+    return base64.urlsafe_b64decode(raw + _PAD[len(raw) & 3])
 
 
+# 签名只依赖载荷本身，签发后同进程内的校验可直接复用；令牌 10 分钟过期，缓存有界即可
+@lru_cache(maxsize=4096)
 def _sign(payload_part: str) -> str:
-    secret = settings.secret_key.encode("utf-8")
-    digest = hmac.new(secret, payload_part.encode("utf-8"), hashlib.sha256).digest()
-    return _b64url_encode(digest)
+    return _b64url_encode(hmac.digest(_SECRET, payload_part.encode("ascii"), "sha256"))
+
+
+# Postgres: 并发安全地初始化默认钱包并取回当前行，一次往返
+# DO UPDATE（空更新）让已存在的行也能 RETURNING，并持有行锁直到事务结束
+_upsert_wallet = pg_insert(DeviceWallet).values(
+    device_id=bindparam("device_id"),
+    credits=1,
+    bonus_used=False,
+    bonus_claims_used=0,
+)
+_UPSERT_WALLET_STMT = _upsert_wallet.on_conflict_do_update(
+    index_elements=[DeviceWallet.device_id],
+    set_={"device_id": _upsert_wallet.excluded.device_id},
+).returning(DeviceWallet)
 
 
 async def _ensure_wallet(db: AsyncSession, device_id: str) -> DeviceWallet:
-    # Postgres: 并发安全地初始化默认钱包
-    await db.execute(
-        text(
-            """
-            INSERT INTO device_wallets (device_id, credits, bonus_used, bonus_claims_used)
-            VALUES (:device_id, 1, false, 0)
-            ON CONFLICT (device_id) DO NOTHING
-            """
-        ),
-        {"device_id": device_id},
-    )
     result = await db.execute(
-        select(DeviceWallet).where(DeviceWallet.device_id == device_id)
+        _UPSERT_WALLET_STMT,
+        {"device_id": device_id},
+        execution_options={"populate_existing": True},
     )
-    wallet = result.scalars().first()
-    if wallet is None:
-        raise UnlockError("WALLET_UNAVAILABLE", "钱包初始化失败", status_code=503)
-    return wallet
+    return result.scalar_one()
 
 
 def _bonus_rewards_earned(
@@ -85,29 +105,45 @@ async def issue_unlock_token(
         if rewards_earned <= wallet.bonus_claims_used:
             raise UnlockError("UNLOCK_REQUIRED", f"每完成 {_BONUS_LEVEL_INTERVAL} 关可获得 1 次奖励")
 
-    payload = {
-        "v": 1,
-        "jti": uuid.uuid4().hex,
+    # v2 载荷：固定字段用 | 拼接，device_id 放最后（可能含 |，解析时最多切 5 刀）
+    jti = os.urandom(16).hex()
+    exp = int(time.time()) + _TOKEN_TTL_SECONDS
+    bonus_earned = _bonus_rewards_earned(completed_levels) if method == "BONUS" else 0
+    raw = f"2|{jti}|{method}|{exp}|{bonus_earned}|{device_id}"
+    payload_part = _b64url_encode(raw.encode("utf-8"))
+    sig_part = _sign(payload_part)
+    return f"{payload_part}.{sig_part}"
+
+
+def _parse_payload(raw: bytes) -> dict:
+    # v1 为 JSON 载荷，保留解析以兼容升级前签发、尚未过期的令牌
+    if raw[:1] == b"{":
+        return json.loads(raw.decode("utf-8"))
+    version, jti, method, exp, bonus_earned, device_id = raw.decode("utf-8").split("|", 5)
+    if version != "2":
+        raise ValueError("unknown payload version")
+    return {
+        "v": 2,
+        "jti": jti,
         "did": device_id,
         "m": method,
-        "exp": int(time.time()) + _TOKEN_TTL_SECONDS,
+        "exp": int(exp),
+        "be": int(bonus_earned),
     }
-    if method == "BONUS":
-        payload["be"] = _bonus_rewards_earned(completed_levels)
-    payload_part = _b64url_encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
-    sig_part = _sign(payload_part)
-    return f"{payload_part}.{sig_part}"
 
 
 def _verify_and_parse(token: str) -> dict:
     parts = token.split(".")
-    if len(parts) != 2:
+    if len(parts) != 2 or not token.isascii():
         raise UnlockError("INVALID_UNLOCK_TOKEN", "解锁令牌格式错误")
     payload_part, sig_part = parts
+    # 32 字节 SHA-256 摘要恒为 43 个 base64url 字符，长度不符直接拒绝（长度本身不是秘密）
+    if len(sig_part) != _SIG_LEN:
+        raise UnlockError("INVALID_UNLOCK_TOKEN", "解锁令牌签名无效")
     if not hmac.compare_digest(_sign(payload_part), sig_part):
         raise UnlockError("INVALID_UNLOCK_TOKEN", "解锁令牌签名无效")
     try:
-        payload = json.loads(_b64url_decode(payload_part).decode("utf-8"))
+        payload = _parse_payload(_b64url_decode(payload_part))
     except Exception:
         raise UnlockError("INVALID_UNLOCK_TOKEN", "解锁令牌解析失败")
     if not isinstance(payload, dict):
@@ -117,51 +153,91 @@ def _verify_and_parse(token: str) -> dict:
     return payload
 
 
+# 一条语句完成：占用 jti → 按需初始化钱包并条件扣减
+# issue 不提交事务，钱包可能尚不存在，所以扣减写成 upsert：新钱包按默认 1 次计
+_CONSUME_STMT = text(
+    """
+    WITH claim AS (
+        INSERT INTO unlock_token_uses (jti, device_id, method)
+        VALUES (:jti, :device_id, :method)
+        ON CONFLICT (jti) DO NOTHING
+        RETURNING jti
+    ), spend AS (
+        INSERT INTO device_wallets AS w (device_id, credits, bonus_used, bonus_claims_used)
+        SELECT :device_id,
+               CASE WHEN :method = 'CREDIT' THEN 0 ELSE 1 END,
+               :method = 'BONUS',
+               CASE WHEN :method = 'BONUS' THEN 1 ELSE 0 END
+        WHERE EXISTS (SELECT 1 FROM claim)
+          AND (:method = 'CREDIT' OR :bonus_rewards_earned > 0)
+        ON CONFLICT (device_id) DO UPDATE SET
+            credits = CASE WHEN :method = 'CREDIT' THEN w.credits - 1 ELSE w.credits END,
+            bonus_claims_used = CASE WHEN :method = 'BONUS'
+                THEN w.bonus_claims_used + 1 ELSE w.bonus_claims_used END,
+            bonus_used = CASE WHEN :method = 'BONUS' THEN true ELSE w.bonus_used END,
+            updated_at = now()
+        WHERE (:method = 'CREDIT' AND w.credits > 0)
+           OR (:method = 'BONUS' AND w.bonus_claims_used < :bonus_rewards_earned)
+        RETURNING w.device_id
+    )
+    SELECT (SELECT count(*) FROM claim) AS claimed,
+           (SELECT count(*) FROM spend) AS spent
+    """
+)
+
+
+def _remember_used_jti(jti: str, exp: int) -> None:
+    # 令牌 TTL 固定，写入顺序大致即过期顺序：先从队头清掉已过期的，
+    # 过期令牌本就会被 _verify_and_parse 拒绝，不让它们把仍有效的挤出去
+    now = int(time.time())
+    while _used_jtis:
+        oldest_jti, oldest_exp = next(iter(_used_jtis.items()))
+        if oldest_exp >= now:
+            break
+        del _used_jtis[oldest_jti]
+    _used_jtis[jti] = exp
+    if len(_used_jtis) > _USED_JTI_CACHE_SIZE:
+        _used_jtis.popitem(last=False)
+
+
 async def consume_unlock_token(db: AsyncSession, device_id: str, token: str) -> str:
     payload = _verify_and_parse(token)
     token_device = payload.get("did")
-    method = str(payload.get("m", "")).upper()
-    jti = str(payload.get("jti", ""))
+    method = payload.get("m")
+    jti = payload.get("jti")
     bonus_rewards_earned = int(payload.get("be", 0))
 
     if token_device != device_id:
         raise UnlockError("INVALID_UNLOCK_TOKEN", "解锁令牌与设备不匹配")
-    if method not in _METHODS or not jti:
+    # 签发时 method 已规范为大写、jti 恒为 32 位小写 hex，这里只做类型与格式校验
+    if (
+        not isinstance(method, str)
+        or method not in _METHODS
+        or not isinstance(jti, str)
+        or not _JTI_RE.match(jti)
+    ):
         raise UnlockError("INVALID_UNLOCK_TOKEN", "解锁令牌字段无效")
 
-    used = await db.get(UnlockTokenUse, jti)
-    if used is not None:
+    # 过期令牌已在 _verify_and_parse 拒绝，缓存命中即重放
+    if jti in _used_jtis:
         raise UnlockError("UNLOCK_TOKEN_USED", "解锁令牌已被使用")
 
-    # 行级锁，保证扣减原子性
-    await db.execute(
-        text(
-            """
-            INSERT INTO device_wallets (device_id, credits, bonus_used, bonus_claims_used)
-            VALUES (:device_id, 1, false, 0)
-            ON CONFLICT (device_id) DO NOTHING
-            """
-        ),
-        {"device_id": device_id},
-    )
     result = await db.execute(
-        select(DeviceWallet)
-        .where(DeviceWallet.device_id == device_id)
-        .with_for_update()
+        _CONSUME_STMT,
+        {
+            "jti": jti,
+            "device_id": device_id,
+            "method": method,
+            "bonus_rewards_earned": bonus_rewards_earned,
+        },
     )
-    wallet = result.scalars().first()
-    if wallet is None:
-        raise UnlockError("WALLET_UNAVAILABLE", "钱包读取失败", status_code=503)
-
-    if method == "CREDIT":
-        if wallet.credits <= 0:
+    claimed, spent = result.one()
+    if not claimed:
+        _remember_used_jti(jti, int(payload.get("exp", 0)))
+        raise UnlockError("UNLOCK_TOKEN_USED", "解锁令牌已被使用")
+    # 扣减失败时 jti 已写入，由调用方异常路径上的 rollback 撤销
+    if not spent:
+        if method == "CREDIT":
             raise UnlockError("UNLOCK_REQUIRED", "可用次数不足")
-        wallet.credits -= 1
-    elif method == "BONUS":
-        if bonus_rewards_earned <= wallet.bonus_claims_used:
-            raise UnlockError("UNLOCK_REQUIRED", f"每完成 {_BONUS_LEVEL_INTERVAL} 关可获得 1 次奖励")
-        wallet.bonus_claims_used += 1
-        wallet.bonus_used = wallet.bonus_claims_used > 0
-
-    db.add(UnlockTokenUse(jti=jti, device_id=device_id, method=method))
+        raise UnlockError("UNLOCK_REQUIRED", f"每完成 {_BONUS_LEVEL_INTERVAL} 关可获得 1 次奖励")
     return method